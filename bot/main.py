@@ -1,15 +1,18 @@
 import asyncio
 import logging
 import os
+import shutil
 import aiohttp
+import aiofiles
+from functools import partial
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import BOT_TOKEN, OUTPUT_DIR
-from core.render_logic import render_animation
-from core.video_logic import create_gif
+from core.render_worker import start_render_workers, submit_render, stop_render_workers
+from core.video_logic import create_gif, create_webp, create_video_stream
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +21,27 @@ logging.basicConfig(level=logging.INFO)
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
+# Shared HTTP session for file downloads (created in main)
+session: aiohttp.ClientSession | None = None
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Size of the MP4 frames, ffmpeg has to be told the size of the raw frames it reads
+VIDEO_RESOLUTION = 512
+
+# Encoder and render options per output format (file extension)
+# GIFs are rendered at a lower resolution, which looks the same at Telegram's display size
+OUTPUT_FORMATS = {
+    "webp": (create_webp, {"resolution": 512}),
+    "gif": (create_gif, {"palettize": True, "resolution": 256}),
+    # Raw frames are piped straight into ffmpeg
+    "mp4": (
+        partial(create_video_stream, width=VIDEO_RESOLUTION, height=VIDEO_RESOLUTION),
+        {"raw": True, "resolution": VIDEO_RESOLUTION},
+    ),
+}
+# Animated WebP is smaller and faster to encode than a GIF
+OUTPUT_FORMAT = "webp"
+
 # --- State Machine ---
 class LogoCreation(StatesGroup):
     waiting_for_images = State()
@@ -34,21 +58,22 @@ def get_shape_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 async def download_image(file_id: str, destination_path: str):
-    """Downloads a file from Telegram."""
+    """Downloads a file from Telegram, returns False if the download failed."""
     file = await bot.get_file(file_id)
     file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
     
-    async with aiohttp.ClientSession() as session:
+    try:
         async with session.get(file_url) as response:
             if response.status == 200:
-                with open(destination_path, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(1024)
-                        if not chunk:
-                            break
-                        f.write(chunk)
+                async with aiofiles.open(destination_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        await f.write(chunk)
                 return True
             return False
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # Connection errors and the session timeouts are reported like a bad status
+        logging.error(f"Download error for {file_id}: {e}")
+        return False
 
 # --- Handlers ---
 
@@ -145,42 +170,39 @@ async def handle_render_command(message: types.Message, state: FSMContext) -> No
     temp_dir = os.path.join(OUTPUT_DIR, str(user_id))
     os.makedirs(temp_dir, exist_ok=True)
     
-    image_paths = []
-    for i, img_data in enumerate(images_data):
-        file_id = img_data['file_id']
-        file_path = os.path.join(temp_dir, f"input_{i}.png")
-        if await download_image(file_id, file_path):
-            image_paths.append(file_path)
-        else:
-            await message.answer(f"Rasm yuklashda xatolik yuz berdi: {file_id}")
+    # Download all images concurrently
+    image_paths = [os.path.join(temp_dir, f"input_{i}.png") for i in range(len(images_data))]
+    results = await asyncio.gather(*[
+        download_image(img_data['file_id'], file_path)
+        for img_data, file_path in zip(images_data, image_paths)
+    ])
+    for img_data, downloaded in zip(images_data, results):
+        if not downloaded:
+            await message.answer(f"Rasm yuklashda xatolik yuz berdi: {img_data['file_id']}")
+            # Remove the images that were (partially) downloaded
+            shutil.rmtree(temp_dir, ignore_errors=True)
             return
             
-    # 2. Render animation frames
-    try:
-        frames = await asyncio.to_thread(render_animation, image_paths, shape, temp_dir)
-    except Exception as e:
-        logging.error(f"Rendering error: {e}")
-        await message.answer(f"Renderlashda kutilmagan xatolik yuz berdi: {e}")
-        return
-        
-    # 3. Create GIF (or video, currently only GIF is planned for Phase 7)
-    output_filename = f"{shape}_{user_id}_{int(asyncio.get_event_loop().time())}.gif"
+    # 2. Render animation frames and create the animation file
+    # Rendering and encoding run in a render process, which keeps its OpenGL context between requests
+    encoder, render_options = OUTPUT_FORMATS[OUTPUT_FORMAT]
+    output_filename = f"{shape}_{user_id}_{int(asyncio.get_event_loop().time())}.{OUTPUT_FORMAT}"
     output_path = os.path.join(OUTPUT_DIR, output_filename)
     
     try:
-        await asyncio.to_thread(create_gif, frames, output_path)
+        await asyncio.wrap_future(submit_render(encoder, image_paths, shape, temp_dir, output_path, **render_options))
     except Exception as e:
-        logging.error(f"GIF creation error: {e}")
-        await message.answer(f"GIF yaratishda xatolik yuz berdi: {e}")
+        logging.error(f"Rendering error: {e}")
+        await message.answer(f"Renderlashda kutilmagan xatolik yuz berdi: {e}")
         return
         
-    # 4. Send result
+    # 3. Send result
     await message.answer_document(
         types.FSInputFile(output_path),
         caption=f"Sizning **{shape.capitalize()}** shaklidagi animatsiyangiz tayyor!"
     )
     
-    # 5. Cleanup (optional, but good practice)
+    # 4. Cleanup (optional, but good practice)
     # Clean up temporary files and directory
     for path in image_paths:
         os.remove(path)
@@ -204,8 +226,19 @@ async def main() -> None:
     # Delete webhook to ensure clean polling start
     await bot.delete_webhook(drop_pending_updates=True)
     
+    # Reuse one HTTP session (and its connections) for all downloads
+    global session
+    session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120, sock_read=30))
+    
+    # Spawn the render processes now, they set up their OpenGL contexts while the bot starts polling
+    start_render_workers()
+    
     # Start the bot
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await session.close()
+        stop_render_workers()
 
 if __name__ == "__main__":
     # Initialize bot and dispatcher here for the main execution block
@@ -0,0 +1,50 @@
+import hashlib
+import os
+import diskcache
+from config import OUTPUT_DIR
+
+# Bump this whenever a change to the renderer or the encoders alters the output,
+# so that animations cached by an older version are not reused.
+CACHE_VERSION = 4
+
+# Disk-backed store of finished animation files (encoded bytes)
+cache = diskcache.Cache(os.path.join(OUTPUT_DIR, "animation_cache"))
+
+def texture_hash(path):
+    """
+    Returns the SHA-256 hex digest of an image file, or None if it cannot be read.
+
+    :param path: Local file path of the image.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        # The renderer falls back to a placeholder texture for unreadable files
+        return None
+
+def animation_key(shape_name, images_paths, output_format, render_options):
+    """
+    Builds the cache key of a finished animation.
+
+    :param shape_name: The name of the 3D shape.
+    :param images_paths: List of local file paths for the images (hashed by content).
+    :param output_format: File extension of the animation, which selects the encoder.
+    :param render_options: Extra arguments for render_animation (e.g. the resolution).
+    """
+    tex_hashes = tuple(texture_hash(path) for path in images_paths)
+    return (CACHE_VERSION, shape_name, tex_hashes, output_format, tuple(sorted(render_options.items())))
+
+def get_animation(key, output_path):
+    """Writes the cached animation to output_path, returns False on a cache miss."""
+    data = cache.get(key)
+    if data is None:
+        return False
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return True
+
+def put_animation(key, output_path):
+    """Stores the animation file at output_path in the cache."""
+    with open(output_path, 'rb') as f:
+        cache[key] = f.read()
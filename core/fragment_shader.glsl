@@ -1,10 +1,12 @@
 #version 330 core
 
 in vec2 v_texcoord;
+flat in float v_layer;
 out vec4 fragColor;
 
-uniform sampler2D u_texture;
+// One layer per input image
+uniform sampler2DArray u_textures;
 
 void main() {
-    fragColor = texture(u_texture, v_texcoord);
+    fragColor = texture(u_textures, vec3(v_texcoord, v_layer));
 }
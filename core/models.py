@@ -1,7 +1,15 @@
 import numpy as np
-from math import sin, cos, tan, pi
+from math import sin, cos, tan, pi, radians, sqrt
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional, the helpers below then run as plain Python/NumPy
+    njit = None
 
 # --- Matrix Utility Functions (based on GLM/OpenGL conventions) ---
+# Matrices are built directly in column-major order (each row of the literal
+# is one column), so their C-order bytes are what OpenGL expects.
 
 def perspective(fovy, aspect, near, far):
     """Creates a perspective projection matrix."""
@@ -11,7 +19,7 @@ def perspective(fovy, aspect, near, far):
         [0.0, f, 0.0, 0.0],
         [0.0, 0.0, (far + near) / (near - far), -1.0],
         [0.0, 0.0, (2.0 * far * near) / (near - far), 0.0]
-    ], dtype=np.float32).T
+    ], dtype=np.float32)
 
 def lookat(eye, center, up):
     """Creates a view matrix (camera)."""
@@ -23,35 +31,98 @@ def lookat(eye, center, up):
     u = np.cross(s, f)
     
     return np.array([
-        [s[0], u[0], -f[0], -np.dot(s, eye)],
-        [s[1], u[1], -f[1], -np.dot(u, eye)],
-        [s[2], u[2], -f[2], np.dot(f, eye)],
-        [0.0, 0.0, 0.0, 1.0]
+        [s[0], u[0], -f[0], 0.0],
+        [s[1], u[1], -f[1], 0.0],
+        [s[2], u[2], -f[2], 0.0],
+        [-np.dot(s, eye), -np.dot(u, eye), np.dot(f, eye), 1.0]
     ], dtype=np.float32)
 
 def translate(v):
     """Creates a translation matrix."""
     return np.array([
-        [1.0, 0.0, 0.0, v[0]],
-        [0.0, 1.0, 0.0, v[1]],
-        [0.0, 0.0, 1.0, v[2]],
-        [0.0, 0.0, 0.0, 1.0]
-    ], dtype=np.float32).T
+        [1.0, 0.0, 0.0, 0.0],
+        [0.0, 1.0, 0.0, 0.0],
+        [0.0, 0.0, 1.0, 0.0],
+        [v[0], v[1], v[2], 1.0]
+    ], dtype=np.float32)
+
+def rotate_into(out, angle, x, y, z):
+    """
+    Writes a rotation matrix around the axis (x, y, z) into a preallocated 4x4 array.
+    
+    :param out: Output float32 array of shape (4, 4), indexed out[column, row].
+    :param angle: Rotation angle in degrees.
+    """
+    a = radians(angle)
+    c = cos(a)
+    s = sin(a)
+    t = 1.0 - c
+    n = sqrt(x*x + y*y + z*z)
+    x, y, z = x / n, y / n, z / n
+    
+    out[0, 0] = t*x*x + c
+    out[0, 1] = t*x*y + s*z
+    out[0, 2] = t*x*z - s*y
+    out[0, 3] = 0.0
+    out[1, 0] = t*x*y - s*z
+    out[1, 1] = t*y*y + c
+    out[1, 2] = t*y*z + s*x
+    out[1, 3] = 0.0
+    out[2, 0] = t*x*z + s*y
+    out[2, 1] = t*y*z - s*x
+    out[2, 2] = t*z*z + c
+    out[2, 3] = 0.0
+    out[3, 0] = 0.0
+    out[3, 1] = 0.0
+    out[3, 2] = 0.0
+    out[3, 3] = 1.0
+    return out
+
+if njit is not None:
+    rotate_into = njit(cache=True)(rotate_into)
+    
+    @njit(cache=True)
+    def _rotate_batch_into(out, angles, x, y, z):
+        for i in range(angles.shape[0]):
+            rotate_into(out[i], angles[i], x, y, z)
+else:
+    def _rotate_batch_into(out, angles, x, y, z):
+        # Without Numba a per-frame Python loop is slower than filling all frames with NumPy
+        a = np.radians(angles)
+        c = np.cos(a)
+        s = np.sin(a)
+        t = 1.0 - c
+        x, y, z = np.array([x, y, z]) / np.linalg.norm([x, y, z])
+        
+        out[:] = 0.0
+        out[:, 0, 0] = t*x*x + c
+        out[:, 1, 0] = t*x*y - s*z
+        out[:, 2, 0] = t*x*z + s*y
+        out[:, 0, 1] = t*x*y + s*z
+        out[:, 1, 1] = t*y*y + c
+        out[:, 2, 1] = t*y*z - s*x
+        out[:, 0, 2] = t*x*z - s*y
+        out[:, 1, 2] = t*y*z + s*x
+        out[:, 2, 2] = t*z*z + c
+        out[:, 3, 3] = 1.0
 
 def rotate(angle, axis):
     """Creates a rotation matrix around an axis (angle in degrees)."""
-    angle = np.radians(angle)
-    c = cos(angle)
-    s = sin(angle)
-    t = 1.0 - c
-    x, y, z = axis / np.linalg.norm(axis)
+    x, y, z = (float(v) for v in axis)
+    return rotate_into(np.empty((4, 4), dtype=np.float32), float(angle), x, y, z)
+
+def rotate_batch(angles, axis, out=None):
+    """
+    Creates an (N, 4, 4) array of rotation matrices around an axis (angles in degrees).
     
-    return np.array([
-        [t*x*x + c,   t*x*y - s*z, t*x*z + s*y, 0.0],
-        [t*x*y + s*z, t*y*y + c,   t*y*z + s*x, 0.0],
-        [t*x*z - s*y, t*y*z + s*x, t*z*z + c,   0.0],
-        [0.0,         0.0,         0.0,         1.0]
-    ], dtype=np.float32).T
+    :param out: Optional preallocated float32 array of shape (N, 4, 4) to fill and return.
+    """
+    angles = np.asarray(angles, dtype=np.float32)
+    if out is None:
+        out = np.empty((len(angles), 4, 4), dtype=np.float32)
+    x, y, z = (float(v) for v in axis)
+    _rotate_batch_into(out, angles, x, y, z)
+    return out
 
 def scale(v):
     """Creates a scale matrix."""
@@ -60,7 +131,7 @@ def scale(v):
         [0.0, v[1], 0.0, 0.0],
         [0.0, 0.0, v[2], 0.0],
         [0.0, 0.0, 0.0, 1.0]
-    ], dtype=np.float32).T
+    ], dtype=np.float32)
 
 # --- Geometry Generation Functions ---
 
@@ -68,21 +139,22 @@ def create_cube(size=1.0):
     """Generates vertices and indices for a cube with texture coordinates."""
     s = size / 2.0
     
-    # Vertices (position, texture coordinate)
-    # Texture coordinates are repeated for each face to allow unique texturing
+    # Vertices (position, texture coordinate, texture layer)
+    # Texture coordinates are repeated for each face to allow unique texturing,
+    # every face samples its own layer of the texture array
     vertices = np.array([
         # Front face
-        [-s, -s, s, 0.0, 0.0], [s, -s, s, 1.0, 0.0], [s, s, s, 1.0, 1.0], [-s, s, s, 0.0, 1.0],
+        [-s, -s, s, 0.0, 0.0, 0.0], [s, -s, s, 1.0, 0.0, 0.0], [s, s, s, 1.0, 1.0, 0.0], [-s, s, s, 0.0, 1.0, 0.0],
         # Back face
-        [-s, -s, -s, 1.0, 0.0], [-s, s, -s, 1.0, 1.0], [s, s, -s, 0.0, 1.0], [s, -s, -s, 0.0, 0.0],
+        [-s, -s, -s, 1.0, 0.0, 1.0], [-s, s, -s, 1.0, 1.0, 1.0], [s, s, -s, 0.0, 1.0, 1.0], [s, -s, -s, 0.0, 0.0, 1.0],
         # Top face
-        [-s, s, s, 0.0, 1.0], [s, s, s, 1.0, 1.0], [s, s, -s, 1.0, 0.0], [-s, s, -s, 0.0, 0.0],
+        [-s, s, s, 0.0, 1.0, 2.0], [s, s, s, 1.0, 1.0, 2.0], [s, s, -s, 1.0, 0.0, 2.0], [-s, s, -s, 0.0, 0.0, 2.0],
         # Bottom face
-        [-s, -s, s, 0.0, 0.0], [-s, -s, -s, 0.0, 1.0], [s, -s, -s, 1.0, 1.0], [s, -s, s, 1.0, 0.0],
+        [-s, -s, s, 0.0, 0.0, 3.0], [-s, -s, -s, 0.0, 1.0, 3.0], [s, -s, -s, 1.0, 1.0, 3.0], [s, -s, s, 1.0, 0.0, 3.0],
         # Right face
-        [s, -s, s, 0.0, 0.0], [s, -s, -s, 1.0, 0.0], [s, s, -s, 1.0, 1.0], [s, s, s, 0.0, 1.0],
+        [s, -s, s, 0.0, 0.0, 4.0], [s, -s, -s, 1.0, 0.0, 4.0], [s, s, -s, 1.0, 1.0, 4.0], [s, s, s, 0.0, 1.0, 4.0],
         # Left face
-        [-s, -s, s, 1.0, 0.0], [-s, s, s, 1.0, 1.0], [-s, s, -s, 0.0, 1.0], [-s, -s, -s, 0.0, 0.0],
+        [-s, -s, s, 1.0, 0.0, 5.0], [-s, s, s, 1.0, 1.0, 5.0], [-s, s, -s, 0.0, 1.0, 5.0], [-s, -s, -s, 0.0, 0.0, 5.0],
     ], dtype=np.float32)
     
     # Indices for two triangles per face
@@ -99,94 +171,95 @@ def create_cube(size=1.0):
 
 def create_cylinder(sides=32, height=0.1, radius=1.0):
     """Generates vertices and indices for a cylinder (coin)."""
-    vertices = []
-    indices = []
+    h = height / 2.0
     
     # Top and Bottom center points
     top_center_index = 0
     bottom_center_index = 1
-    vertices.append([0.0, height / 2.0, 0.0, 0.5, 0.5]) # Top center (0)
-    vertices.append([0.0, -height / 2.0, 0.0, 0.5, 0.5]) # Bottom center (1)
-    
-    # Side vertices
-    for i in range(sides):
-        angle = 2.0 * pi * i / sides
-        x = radius * cos(angle)
-        z = radius * sin(angle)
-        
-        # Top edge vertex (for side and top face)
-        vertices.append([x, height / 2.0, z, cos(angle) * 0.5 + 0.5, sin(angle) * 0.5 + 0.5]) # Top face UV
-        # Bottom edge vertex (for side and bottom face)
-        vertices.append([x, -height / 2.0, z, cos(angle) * 0.5 + 0.5, sin(angle) * 0.5 + 0.5]) # Bottom face UV
-        
-        # Side face vertices (repeated for proper side UV mapping)
-        vertices.append([x, height / 2.0, z, i / sides, 1.0]) # Side Top UV
-        vertices.append([x, -height / 2.0, z, i / sides, 0.0]) # Side Bottom UV
-        
-    # Indices for Top and Bottom faces
-    for i in range(sides):
-        # The indices for the vertices are offset by 2 (for the center points)
-        # and then by 4 for each side segment (4 vertices per segment)
-        
-        # Indices for Top and Bottom faces
-        # Vertices for top/bottom face are at index 2 + i*4 and 3 + i*4
-        i_top_curr = 2 + i * 4
-        i_top_next = 2 + (i + 1) % sides * 4
-        i_bottom_curr = 3 + i * 4
-        i_bottom_next = 3 + (i + 1) % sides * 4
-        
+    # Vertices (position, texture coordinate, texture layer)
+    # The top face, bottom face and side sample their own layers of the texture array
+    centers = np.array([
+        [0.0, h, 0.0, 0.5, 0.5, 0.0],  # Top center (0)
+        [0.0, -h, 0.0, 0.5, 0.5, 1.0], # Bottom center (1)
+    ], dtype=np.float32)
+    
+    # Side vertices, computed for all segments at once
+    angles = np.linspace(0.0, 2.0 * pi, sides, endpoint=False, dtype=np.float32)
+    c = np.cos(angles)
+    s = np.sin(angles)
+    x = radius * c
+    z = radius * s
+    top = np.full(sides, h, dtype=np.float32)
+    bottom = np.full(sides, -h, dtype=np.float32)
+    u_face = c * 0.5 + 0.5
+    v_face = s * 0.5 + 0.5
+    u_side = np.arange(sides, dtype=np.float32) / sides
+    top_layer = np.zeros(sides)
+    bottom_layer = np.ones(sides)
+    side_layer = np.full(sides, 2.0)
+    
+    # Each segment has 4 vertices: the top and bottom edge vertices (for the
+    # top and bottom faces) and the same two repeated for proper side UV mapping
+    segments = np.stack([
+        np.column_stack([x, top, z, u_face, v_face, top_layer]),                # Top face UV
+        np.column_stack([x, bottom, z, u_face, v_face, bottom_layer]),          # Bottom face UV
+        np.column_stack([x, top, z, u_side, np.ones(sides), side_layer]),       # Side Top UV
+        np.column_stack([x, bottom, z, u_side, np.zeros(sides), side_layer]),   # Side Bottom UV
+    ], axis=1).reshape(-1, 6)
+    vertices = np.concatenate([centers, segments]).astype(np.float32)
+    
+    # The indices for the vertices are offset by 2 (for the center points)
+    # and then by 4 for each side segment (4 vertices per segment)
+    curr = 2 + np.arange(sides) * 4
+    nxt = 2 + (np.arange(sides) + 1) % sides * 4
+    
+    indices = np.column_stack([
         # Top face (Triangle fan from center)
-        indices.extend([top_center_index, i_top_curr, i_top_next])
-        
+        np.full(sides, top_center_index), curr, nxt,
         # Bottom face (Triangle fan from center) - Winding order reversed for correct culling
-        indices.extend([bottom_center_index, i_bottom_next, i_bottom_curr])
-        
+        np.full(sides, bottom_center_index), nxt + 1, curr + 1,
         # Side faces (Two triangles per side)
-        # Vertices for side face are at index 4 + i*4 and 5 + i*4
-        i_side_top_curr = 4 + i * 4
-        i_side_bottom_curr = 5 + i * 4
-        i_side_top_next = 4 + (i + 1) % sides * 4
-        i_side_bottom_next = 5 + (i + 1) % sides * 4
-        
         # First triangle: Top-Current, Bottom-Current, Top-Next
-        indices.extend([i_side_top_curr, i_side_bottom_curr, i_side_top_next])
+        curr + 2, curr + 3, nxt + 2,
         # Second triangle: Top-Next, Bottom-Current, Bottom-Next
-        indices.extend([i_side_top_next, i_side_bottom_curr, i_side_bottom_next])
-        
-    return np.array(vertices, dtype=np.float32), np.array(indices, dtype=np.uint32)
+        nxt + 2, curr + 3, nxt + 3,
+    ]).reshape(-1)
+    
+    return vertices, indices.astype(np.uint32)
 
 def create_pyramid(size=1.0, height=1.0):
     """Generates vertices and indices for a square-based pyramid."""
     s = size / 2.0
     h = height
     
-    # Vertices (position, texture coordinate)
+    # Vertices (position, texture coordinate, texture layer)
+    # The base and every side sample their own layer of the texture array
     # Base vertices
-    v0 = [-s, 0.0, s, 0.0, 0.0] # Base BL
-    v1 = [s, 0.0, s, 1.0, 0.0]  # Base BR
-    v2 = [s, 0.0, -s, 1.0, 1.0] # Base TR
-    v3 = [-s, 0.0, -s, 0.0, 1.0] # Base TL
+    v0 = [-s, 0.0, s, 0.0, 0.0, 0.0] # Base BL
+    v1 = [s, 0.0, s, 1.0, 0.0, 0.0]  # Base BR
+    v2 = [s, 0.0, -s, 1.0, 1.0, 0.0] # Base TR
+    v3 = [-s, 0.0, -s, 0.0, 1.0, 0.0] # Base TL
     
-    # Apex vertex
+    # Apex vertex (position and texture coordinate, the layer is set per face)
     v_apex = [0.0, h, 0.0, 0.5, 1.0]
     
     # Side face vertices (repeated for unique UV mapping)
     # Front face
-    v4 = [-s, 0.0, s, 0.0, 0.0]
-    v5 = [s, 0.0, s, 1.0, 0.0]
-    v6 = v_apex
+    v4 = [-s, 0.0, s, 0.0, 0.0, 1.0]
+    v5 = [s, 0.0, s, 1.0, 0.0, 1.0]
+    v6 = v_apex + [1.0]
     # Right face
-    v7 = [s, 0.0, s, 0.0, 0.0]
-    v8 = [s, 0.0, -s, 1.0, 0.0]
-    v9 = v_apex
+    v7 = [s, 0.0, s, 0.0, 0.0, 2.0]
+    v8 = [s, 0.0, -s, 1.0, 0.0, 2.0]
+    v9 = v_apex + [2.0]
     # Back face
-    v10 = [s, 0.0, -s, 0.0, 0.0]
-    v11 = [-s, 0.0, -s, 1.0, 0.0]
-    v12 = v_apex
+    v10 = [s, 0.0, -s, 0.0, 0.0, 3.0]
+    v11 = [-s, 0.0, -s, 1.0, 0.0, 3.0]
+    v12 = v_apex + [3.0]
     # Left face
-    v13 = [-s, 0.0, -s, 0.0, 0.0]
-    v14 = [-s, 0.0, s, 1.0, 0.0]
-    v15 = v_apex
+    v13 = [-s, 0.0, -s, 0.0, 0.0, 4.0]
+    v14 = [-s, 0.0, s, 1.0, 0.0, 4.0]
+    v15 = v_apex + [4.0]
     
     vertices = np.array([
         # Base (v0, v1, v2, v3)
@@ -1,8 +1,10 @@
 import os
+import threading
 import numpy as np
 from PIL import Image
-from core.renderer import OffscreenRenderer
-from core.models import MODELS, perspective, lookat, rotate, translate, scale
+from core.renderer import OffscreenRenderer, BATCH_SIZE
+from core.video_logic import gif_palette, to_gif_frame
+from core.models import MODELS, perspective, lookat, rotate_batch, translate, scale
 from math import radians
 
 # Configuration for rendering
@@ -12,98 +14,106 @@ FPS = 30
 DURATION = 5 # seconds
 TOTAL_FRAMES = FPS * DURATION
 
-def render_animation(images_paths, shape_name, output_path):
+# Renderer shared by all renders of this process (see get_renderer)
+_renderer = None
+_renderer_lock = threading.Lock()
+
+def get_renderer():
+    """
+    Returns the renderer of this process, creating it on first use.
+    
+    Creating the OpenGL context, compiling the shaders and allocating the FBO
+    is only done once, renders just swap geometry and textures. The renderer
+    must only be used by one render at a time (the render worker runs one job at a time).
+    """
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = OffscreenRenderer(RENDER_WIDTH, RENDER_HEIGHT)
+        return _renderer
+
+def render_animation(images_paths, shape_name, output_path, palettize=False, resolution=RENDER_WIDTH, raw=False):
     """
     Renders a 3D animation of the given shape textured with the provided images.
     
     :param images_paths: List of local file paths for the images.
     :param shape_name: The name of the 3D shape ('cube', 'coin', 'pyramid').
     :param output_path: The path to save the final GIF/Video.
-    :return: List of PIL Image objects (frames).
+    :param palettize: Convert the frames to one shared palette of 255 colors plus a transparent index (mode 'P'), ready for create_gif.
+    :param resolution: Width and height of the frames in pixels. GPU work, readback
+        and encoding all scale with the pixel count.
+    :param raw: Yield the raw RGBA bytes of each frame instead of PIL Images, ready for create_video_stream.
+    :return: Iterator of PIL Image objects (or raw bytes) per frame, produced as they are rendered.
     """
     
-    # 1. Initialize Renderer
-    renderer = OffscreenRenderer(RENDER_WIDTH, RENDER_HEIGHT)
-    
-    # 2. Setup Camera
-    # Simple camera setup: looking at the origin from a distance
-    eye = np.array([0.0, 0.0, 3.0])
-    center = np.array([0.0, 0.0, 0.0])
-    up = np.array([0.0, 1.0, 0.0])
-    
-    view_matrix = lookat(eye, center, up)
-    projection_matrix = perspective(fovy=45.0, aspect=RENDER_WIDTH/RENDER_HEIGHT, near=0.1, far=100.0)
-    
-    renderer.set_camera(view_matrix, projection_matrix)
-    
-    # 3. Load Model
-    if shape_name not in MODELS:
-        raise ValueError(f"Unknown shape: {shape_name}")
+    # 1. Initialize Renderer (shared, only the resources of this animation are released)
+    renderer = get_renderer()
+    try:
+        # Everything loaded below is released in the finally block, also when loading fails
+        renderer.set_resolution(resolution, resolution)
         
-    vertices, indices = MODELS[shape_name]()
-    renderer.load_geometry(vertices, indices)
-    
-    # 4. Load Textures
-    textures = []
-    for path in images_paths:
-        try:
-            img = Image.open(path).convert('RGBA')
-            texture = renderer.ctx.texture(img.size, 4, img.tobytes())
-            textures.append(texture)
-        except Exception as e:
-            print(f"Error loading texture {path}: {e}")
-            # Use a placeholder texture if loading fails
-            textures.append(renderer.ctx.texture((1, 1), 4, bytes([255, 0, 255, 255]))) # Magenta placeholder
+        # 2. Setup Camera
+        # Simple camera setup: looking at the origin from a distance
+        eye = np.array([0.0, 0.0, 3.0])
+        center = np.array([0.0, 0.0, 0.0])
+        up = np.array([0.0, 1.0, 0.0])
+        
+        view_matrix = lookat(eye, center, up)
+        projection_matrix = perspective(fovy=45.0, aspect=RENDER_WIDTH/RENDER_HEIGHT, near=0.1, far=100.0)
+        
+        renderer.set_camera(view_matrix, projection_matrix)
+        
+        # 3. Load Model
+        if shape_name not in MODELS:
+            raise ValueError(f"Unknown shape: {shape_name}")
             
-    # Handle texture count mismatch for cube (6 faces)
-    if shape_name == 'cube' and len(textures) < 6:
-        # Repeat textures if not enough are provided for a cube
-        while len(textures) < 6:
-            textures.extend(textures)
-        textures = textures[:6]
-    
-        # For other shapes, we'll just use the first texture for now
-        if shape_name != 'cube' and not textures:
-            # Fallback if no textures are loaded
-            textures.append(renderer.ctx.texture((1, 1), 4, bytes([255, 255, 255, 255]))) # White placeholder
+        vertices, indices = MODELS[shape_name]()
+        renderer.load_geometry(vertices, indices)
         
+        # 4. Load Textures
+        # All images go into one texture array, each face of the model samples its own layer
+        images = []
+        for path in images_paths:
+            try:
+                images.append(Image.open(path).convert('RGBA'))
+            except Exception as e:
+                print(f"Error loading texture {path}: {e}")
+                # Use a placeholder texture if loading fails
+                images.append(Image.new('RGBA', (1, 1), (255, 0, 255, 255))) # Magenta placeholder
+                
         # Ensure there is at least one texture
-        if not textures:
-            textures.append(renderer.ctx.texture((1, 1), 4, bytes([255, 255, 255, 255]))) # White placeholder
+        if not images:
+            images.append(Image.new('RGBA', (1, 1), (255, 255, 255, 255))) # White placeholder
+            
+        renderer.load_texture_array(images)
         
-    # 5. Render Loop
-    frames = []
-    for frame_num in range(TOTAL_FRAMES):
-        # Calculate rotation angle (360 degrees over the duration)
-        angle = (frame_num / TOTAL_FRAMES) * 360.0
+        # The frames show the textures unlit, so the textures make a good palette sample
+        palette = gif_palette(images) if palettize else None
         
-        # Simple rotation around the Y-axis
-        model_matrix = rotate(angle, np.array([0.0, 1.0, 0.0]))
+        # 5. Render Loop
+        # Calculate rotation angles (360 degrees over the duration)
+        angles = np.arange(TOTAL_FRAMES) * (360.0 / TOTAL_FRAMES)
         
-        # Select texture based on shape and frame (simple cycling for cube)
-        if shape_name == 'cube':
-            # Cube faces are rendered sequentially, so we need to handle texture switching
-            # This is a simplification. Proper cube texturing requires 6 draw calls or a texture array.
-            # For now, we'll use the first texture for the whole object.
-            current_texture = textures[0]
-        elif shape_name == 'coin':
-            # For coin, we can alternate between the first two textures for front/back
-            # This requires a more complex shader or multiple draw calls, which is too complex for this phase.
-            # For now, use the first texture.
-            current_texture = textures[0]
-        else:
-            current_texture = textures[0]
-            
-        # Render the frame
-        frame_image = renderer.render_frame(model_matrix, current_texture)
-        frames.append(frame_image)
+        # Simple rotation around the Y-axis, computed and uploaded for all frames at once
+        model_matrices = rotate_batch(angles, np.array([0.0, 1.0, 0.0]))
+        renderer.set_all_models(model_matrices)
         
-    # 6. Cleanup
-    for texture in textures:
-        texture.release()
-    renderer.release()
-    
-    return frames
+        for first in range(0, TOTAL_FRAMES, BATCH_SIZE):
+            # One draw call for the whole batch
+            frames = renderer.render_frames(range(first, min(first + BATCH_SIZE, TOTAL_FRAMES)))
+            
+            # Hand the frames over in order, only one batch is kept in memory here
+            # (the encoder decides how many frames it holds, see core/video_logic.py)
+            for frame in frames:
+                if raw:
+                    yield frame.tobytes()
+                elif palettize:
+                    yield to_gif_frame(frame, palette)
+                else:
+                    yield frame
+    finally:
+        # 6. Cleanup
+        renderer.release_per_request()
 
 if __name__ == '__main__':
     # Example usage for testing (requires dummy files)
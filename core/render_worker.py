@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from queue import Queue, Full
+from core.renderer import BATCH_SIZE
+from core.render_logic import render_animation, get_renderer
+from core.animation_cache import animation_key, get_animation, put_animation
+
+# Number of render processes, each one owns a single OpenGL context (e.g. one per GPU)
+RENDER_WORKERS = 1
+
+# Pool of render processes, created by start_render_workers
+_executor = None
+
+def _init_worker():
+    # Set up the OpenGL context as soon as the process is spawned, before it runs a job
+    get_renderer()
+
+# Marks the end of the frames in the encoder queue
+_END_OF_FRAMES = object()
+
+def _feed(queue, item, encoding):
+    # Gives up if the encoder stopped early (it failed), the caller raises its error
+    while not encoding.done():
+        try:
+            queue.put(item, timeout=0.1)
+            return
+        except Full:
+            pass
+
+def _encode_while_rendering(encoder, frames, output_path):
+    """
+    Runs the encoder on its own thread, so frames are encoded while the next batch
+    is rendered (and cached) on this one. All OpenGL calls stay on this thread.
+    """
+    # At most about one batch waits for the encoder
+    queue = Queue(maxsize=BATCH_SIZE)
+    
+    def queued_frames():
+        while (frame := queue.get()) is not _END_OF_FRAMES:
+            yield frame
+    
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        encoding = pool.submit(encoder, queued_frames(), output_path)
+        try:
+            for frame in frames:
+                if encoding.done():
+                    break
+                _feed(queue, frame, encoding)
+        finally:
+            frames.close()
+            _feed(queue, _END_OF_FRAMES, encoding)
+        encoding.result()
+
+def _render_job(encoder, images_paths, shape_name, work_dir, output_path, render_options):
+    # The same images, shape and format always give the same file. Frames are cheaper
+    # to render again than to cache, the encoded animation is not.
+    key = animation_key(shape_name, images_paths, os.path.splitext(output_path)[1], render_options)
+    if get_animation(key, output_path):
+        return output_path
+    
+    frames = render_animation(images_paths, shape_name, work_dir, **render_options)
+    _encode_while_rendering(encoder, frames, output_path)
+    put_animation(key, output_path)
+    return output_path
+
+def start_render_workers(workers=RENDER_WORKERS):
+    """
+    Starts the pool of long-lived render processes.
+    
+    The processes are spawned right away (without waiting for them to be ready),
+    so the first render does not pay for the imports and the OpenGL context.
+    
+    :param workers: Number of render processes.
+    """
+    global _executor
+    if _executor is None:
+        # Spawn fresh processes, OpenGL contexts do not survive a fork
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+        # The pool only spawns a process when a job is submitted and no process is idle,
+        # so one warm-up job per process starts all of them
+        for _ in range(workers):
+            _executor.submit(_init_worker)
+
+def _restart_render_workers():
+    # A broken pool rejects every new job, so it is replaced by a fresh one
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    start_render_workers()
+
+def submit_render(encoder, images_paths, shape_name, work_dir, output_path, **render_options):
+    """
+    Renders an animation in a render process and encodes it to a file.
+    
+    :param encoder: Function writing the frames to a file, e.g. create_gif.
+    :param images_paths: List of local file paths for the images.
+    :param shape_name: The name of the 3D shape ('cube', 'coin', 'pyramid').
+    :param work_dir: Directory for temporary files of this request.
+    :param output_path: The path to save the final GIF/Video.
+    :param render_options: Extra arguments for render_animation (e.g. palettize=True for create_gif).
+    :return: concurrent.futures.Future resolving to output_path.
+    """
+    start_render_workers()
+    args = (_render_job, encoder, images_paths, shape_name, work_dir, output_path, render_options)
+    try:
+        return _executor.submit(*args)
+    except BrokenProcessPool:
+        # A render process died (e.g. a driver crash or running out of memory)
+        _restart_render_workers()
+        return _executor.submit(*args)
+
+def stop_render_workers():
+    """Shuts down the render processes."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
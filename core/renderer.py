@@ -1,54 +1,120 @@
 import moderngl
 import numpy as np
+from functools import lru_cache
 from PIL import Image
 # Import matrix utilities from models.py
 from core.models import perspective
 
+# Number of frames rendered by a single instanced draw call (must match vertex_shader.glsl)
+BATCH_SIZE = 32
+# The frames of a batch are laid out as tiles of an atlas with this many columns
+ATLAS_COLUMNS = 8
+ATLAS_ROWS = BATCH_SIZE // ATLAS_COLUMNS
+# Number of model matrices in the Models uniform block (must match vertex_shader.glsl),
+# 256 matrices are 16 KB, the smallest uniform block size OpenGL guarantees
+MAX_FRAMES = 256
+# Width and height every texture is resized to, before it is uploaded
+TEXTURE_SIZE = 512
+
+# Not exported by moderngl
+GL_CLIP_DISTANCE0 = 0x3000
+
+@lru_cache(maxsize=None)
+def _read_shader(path):
+    with open(path, 'r') as f:
+        return f.read()
+
 class OffscreenRenderer:
     def __init__(self, width=512, height=512):
-        self.width = width
-        self.height = height
-        
         # Create a headless context
         # Use a more robust way to create a headless context
         self.ctx = moderngl.create_context(standalone=True, require=330)
         
         # Create a framebuffer object (FBO) for off-screen rendering
-        self.fbo = self.ctx.framebuffer(
-            color_attachments=[self.ctx.texture((width, height), 4)]
-        )
+        self.fbo = None
+        self.set_resolution(width, height)
         
         self.ctx.enable(moderngl.DEPTH_TEST)
         self.ctx.enable(moderngl.CULL_FACE)
         
-        # Load shaders
-        with open('core/vertex_shader.glsl', 'r') as f:
-            vertex_shader = f.read()
-        with open('core/fragment_shader.glsl', 'r') as f:
-            fragment_shader = f.read()
-            
+        # The vertex shader clips each frame to its own tile
+        for i in range(4):
+            self.ctx.enable_direct(GL_CLIP_DISTANCE0 + i)
+        
+        # Load shaders (the sources are only read once per process)
+        # The program is compiled once per render process (see render_worker), moderngl has no
+        # program binary API, and across restarts the driver's own shader cache already applies
         self.program = self.ctx.program(
-            vertex_shader=vertex_shader,
-            fragment_shader=fragment_shader,
+            vertex_shader=_read_shader('core/vertex_shader.glsl'),
+            fragment_shader=_read_shader('core/fragment_shader.glsl'),
         )
         
         # Uniforms
-        self.program['model'].write(np.identity(4, dtype='f4'))
+        # The model matrices of all frames live in one uniform buffer (see set_all_models),
+        # each batch only uploads the frame numbers its instances draw
+        self.models_ubo = self.ctx.buffer(reserve=MAX_FRAMES * 64)
+        self.models_ubo.bind_to_uniform_block(0)
+        self.program['Models'].binding = 0
+        self._frame_ids = np.zeros(BATCH_SIZE, dtype='i4')
+        self.program['frame_ids'].write(self._frame_ids)
+        self.program['columns'].value = ATLAS_COLUMNS
+        self.program['rows'].value = ATLAS_ROWS
         self.program['view'].write(np.identity(4, dtype='f4'))
         self.program['projection'].write(np.identity(4, dtype='f4'))
         
-        # Placeholder for VBO and VAO
+        # Placeholder for VBO, index buffer, VAO and the texture array
         self.vbo = None
+        self.ibo = None
         self.vao = None
+        self.textures = None
+        
+    def set_resolution(self, width, height):
+        """
+        Changes the size of the rendered frames.
         
-    def load_texture(self, image_path):
-        img = Image.open(image_path).convert('RGBA')
-        texture = self.ctx.texture(img.size, 4, img.tobytes())
-        return texture
+        The FBO holds a whole batch of frames, one per atlas tile. It is only
+        reallocated when it grows, smaller frames use part of it.
+        """
+        self.width = width
+        self.height = height
+        self.atlas_width = width * ATLAS_COLUMNS
+        self.atlas_height = height * ATLAS_ROWS
+        
+        if self.fbo is None or self.atlas_width > self.fbo.width or self.atlas_height > self.fbo.height:
+            if self.fbo is not None:
+                self._release_fbo()
+            self.color_attachment = self.ctx.texture((self.atlas_width, self.atlas_height), 4)
+            self.fbo = self.ctx.framebuffer(color_attachments=[self.color_attachment])
+            
+            # Persistent readback buffer, reused for every batch
+            self._readback = bytearray(self.atlas_width * self.atlas_height * 4)
+        
+        self.fbo.viewport = (0, 0, self.atlas_width, self.atlas_height)
+
+    def load_texture_array(self, images):
+        """
+        Uploads the images as the layers of one mipmapped texture array, bound for all frames.
+        
+        :param images: List of PIL Image objects, resized to TEXTURE_SIZE x TEXTURE_SIZE.
+        """
+        # Large photos are scaled down once on the CPU, a fixed power-of-two size keeps
+        # GPU memory and upload time bounded and gives a full mipmap chain
+        size = (TEXTURE_SIZE, TEXTURE_SIZE)
+        data = b''.join(img.convert('RGBA').resize(size, Image.LANCZOS).tobytes() for img in images)
+        
+        self.textures = self.ctx.texture_array((size[0], size[1], len(images)), 4, data)
+        # Trilinear filtering, so the textures do not shimmer when faces turn away from the camera
+        self.textures.build_mipmaps()
+        self.textures.filter = (moderngl.LINEAR_MIPMAP_LINEAR, moderngl.LINEAR)
+        self.textures.use(0)
+        self.program['u_textures'].value = 0
+        # Faces with a higher layer than available wrap around to the first images
+        self.program['layers'].value = len(images)
 
     def load_geometry(self, vertices, indices):
-        # Vertices: (x, y, z, u, v)
+        # Vertices: (x, y, z, u, v, layer)
         self.vbo = self.ctx.buffer(vertices.astype('f4').tobytes())
+        self.ibo = self.ctx.buffer(indices.astype('i4').tobytes())
         
         # VAO (Vertex Array Object)
         self.vao = self.ctx.vertex_array(
@@ -56,45 +122,110 @@ class OffscreenRenderer:
             [
                 # in_position: 3 floats, offset 0
                 # in_texcoord: 2 floats, offset 3 * 4 bytes
-                (self.vbo, '3f 2f', 'in_position', 'in_texcoord') # 3 floats for position, 2 for texture coords
+                # in_layer: 1 float, offset 5 * 4 bytes
+                (self.vbo, '3f 2f 1f', 'in_position', 'in_texcoord', 'in_layer') # 3 floats for position, 2 for texture coords, 1 for texture layer
             ],
-            index_buffer=self.ctx.buffer(indices.astype('i4').tobytes())
+            index_buffer=self.ibo
         )
 
-    def render_frame(self, model_matrix, texture):
+    def set_all_models(self, model_matrices):
+        """
+        Uploads the model matrices of all frames of the animation, once per animation.
+        
+        :param model_matrices: Array of shape (N, 4, 4) with N <= MAX_FRAMES, in column-major order.
+        """
+        if len(model_matrices) > MAX_FRAMES:
+            raise ValueError(f"At most {MAX_FRAMES} model matrices can be uploaded, got {len(model_matrices)}")
+        self.models_ubo.write(np.ascontiguousarray(model_matrices, dtype='f4'))
+
+    def render_frame(self, model_matrix):
+        return self.render_batch(np.array([model_matrix]))[0]
+
+    def render_batch(self, model_matrices):
+        """
+        Renders up to BATCH_SIZE frames, replacing the matrices uploaded by set_all_models.
+        
+        :param model_matrices: Array of shape (N, 4, 4), one model matrix per frame.
+        :return: List of N PIL Image objects (frames).
+        """
+        self.set_all_models(model_matrices)
+        return self.render_frames(range(len(model_matrices)))
+
+    def render_frames(self, frame_numbers):
+        """
+        Renders up to BATCH_SIZE frames with a single instanced draw call and one readback.
+        
+        The model matrices from set_all_models and the texture array from
+        load_texture_array are used for all frames.
+        
+        :param frame_numbers: Indices into the matrices uploaded by set_all_models.
+        :return: List of PIL Image objects (frames), in the order of frame_numbers.
+        """
+        count = len(frame_numbers)
+        if count > BATCH_SIZE:
+            raise ValueError(f"At most {BATCH_SIZE} frames can be rendered per batch, got {count}")
+        
         self.fbo.use()
         self.ctx.clear(0.0, 0.0, 0.0, 0.0) # Clear with transparent background
         
         # Update uniforms
-        self.program['model'].write(model_matrix.astype('f4'))
-        
-        # Bind texture
-        texture.use(0)
-        self.program['u_texture'].value = 0
+        self._frame_ids[:count] = frame_numbers
+        self.program['frame_ids'].write(self._frame_ids)
         
-        # Render
-        self.vao.render(moderngl.TRIANGLES)
+        # Render (instance i is drawn into atlas tile i)
+        self.vao.render(moderngl.TRIANGLES, instances=count)
         
-        # Read pixels
-        self.ctx.finish() # Ensure all rendering commands are executed
-        image_data = self.fbo.read(components=4, dtype='f1')
+        # Read only the atlas rows that were drawn (blocks until rendering is done)
+        rows = -(-count // ATLAS_COLUMNS)
+        self.fbo.read_into(
+            self._readback,
+            viewport=(0, 0, self.atlas_width, rows * self.height),
+            components=4,
+            dtype='f1',
+        )
         
-        # Convert to numpy array and then to PIL Image
-        image_array = np.frombuffer(image_data, dtype=np.float32).reshape(self.height, self.width, 4)
-        image_array = (image_array * 255).astype(np.uint8)
+        # View the readback buffer as pixel rows, the first atlas row is at the bottom
+        pixels = np.frombuffer(self._readback, dtype=np.uint8, count=self.atlas_width * rows * self.height * 4)
+        pixels = pixels.reshape(rows * self.height, self.atlas_width, 4)
         
-        return Image.fromarray(image_array, 'RGBA')
+        frames = []
+        for i in range(count):
+            x = (i % ATLAS_COLUMNS) * self.width
+            y = (i // ATLAS_COLUMNS) * self.height
+            # OpenGL rows start at the bottom, so the tile is flipped.
+            # The copy gives each frame its own pixels, since the readback buffer is reused.
+            tile = np.ascontiguousarray(pixels[y:y + self.height, x:x + self.width][::-1])
+            frames.append(Image.frombuffer('RGBA', (self.width, self.height), tile, 'raw', 'RGBA', 0, 1))
+        return frames
 
     def set_camera(self, view_matrix, projection_matrix):
-        self.program['view'].write(view_matrix.astype('f4'))
-        self.program['projection'].write(projection_matrix.astype('f4'))
+        # The matrices from core.models are contiguous float32 in column-major order
+        self.program['view'].write(view_matrix.tobytes())
+        self.program['projection'].write(projection_matrix.tobytes())
 
-    def release(self):
-        if self.vbo:
-            self.vbo.release()
+    def release_per_request(self):
+        """Releases the geometry and textures of the last request, so the renderer can be reused."""
         if self.vao:
             self.vao.release()
+        if self.vbo:
+            self.vbo.release()
+        if self.ibo:
+            self.ibo.release()
+        if self.textures:
+            self.textures.release()
+        self.vbo = None
+        self.ibo = None
+        self.vao = None
+        self.textures = None
+
+    def _release_fbo(self):
         self.fbo.release()
+        self.color_attachment.release()
+
+    def release(self):
+        self.release_per_request()
+        self._release_fbo()
+        self.models_ubo.release()
         self.ctx.release()
 
 if __name__ == '__main__':
@@ -2,14 +2,43 @@
 
 in vec3 in_position;
 in vec2 in_texcoord;
+in float in_layer;
 
 out vec2 v_texcoord;
+flat out float v_layer;
 
-uniform mat4 model;
+// Model matrices of all frames of the animation (must match MAX_FRAMES in renderer.py)
+layout(std140) uniform Models {
+    mat4 models[256];
+};
+// Frame rendered by each instance (must match BATCH_SIZE in renderer.py)
+uniform int frame_ids[32];
 uniform mat4 view;
 uniform mat4 projection;
 
+// Number of layers in the texture array
+uniform int layers;
+
+// Layout of the frame atlas, in tiles
+uniform int columns;
+uniform int rows;
+
 void main() {
-    gl_Position = projection * view * model * vec4(in_position, 1.0);
+    vec4 position = projection * view * models[frame_ids[gl_InstanceID]] * vec4(in_position, 1.0);
+    
+    // Clip against the sides of the view frustum here, since the hardware
+    // only clips against the edges of the whole atlas
+    gl_ClipDistance[0] = position.w + position.x;
+    gl_ClipDistance[1] = position.w - position.x;
+    gl_ClipDistance[2] = position.w + position.y;
+    gl_ClipDistance[3] = position.w - position.y;
+    
+    // Move the frame into its own tile of the atlas
+    vec2 grid = vec2(columns, rows);
+    vec2 tile = vec2(gl_InstanceID % columns, gl_InstanceID / columns);
+    position.xy = (position.xy + position.w * (2.0 * tile + 1.0 - grid)) / grid;
+    
+    gl_Position = position;
     v_texcoord = in_texcoord;
+    v_layer = float(int(in_layer) % layers);
 }
@@ -1,48 +1,178 @@
+import itertools
+import subprocess
+import av
 import imageio.v3 as iio
+import numpy as np
 from PIL import Image
-from typing import List
+from typing import Iterable, List
 
 # Configuration for rendering (must match render_logic.py)
 FPS = 30
 
-def create_gif(frames: List[Image.Image], output_path: str):
+# Palette index reserved for transparent pixels in GIFs
+GIF_TRANSPARENT_INDEX = 255
+
+# Largest side of the samples a GIF palette is computed from
+PALETTE_SAMPLE_SIZE = 256
+
+def gif_palette(images: List[Image.Image]) -> Image.Image:
+    """
+    Builds the palette shared by all GIF frames (one index is left free for transparency).
+    
+    :param images: Sample images covering the colors of the animation (e.g. the textures).
     """
-    Creates a GIF from a list of PIL Image frames.
+    # Small copies keep the colors, quantizing full-size photos only costs time
+    samples = []
+    for img in images:
+        sample = img.convert('RGB')
+        sample.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+        samples.append(sample)
     
-    :param frames: List of PIL Image objects.
+    # Quantize all samples together, side by side
+    mosaic = Image.new('RGB', (sum(img.width for img in samples), max(img.height for img in samples)))
+    x = 0
+    for img in samples:
+        mosaic.paste(img, (x, 0))
+        x += img.width
+    return mosaic.quantize(colors=255)
+
+def to_gif_frame(frame: Image.Image, palette: Image.Image) -> Image.Image:
+    """Converts an RGBA frame to the shared GIF palette (see gif_palette)."""
+    indexed = frame.convert('RGB').quantize(palette=palette)
+    # The transparent background gets the reserved palette index
+    transparent = frame.getchannel('A').point(lambda a: 255 if a < 128 else 0)
+    indexed.paste(GIF_TRANSPARENT_INDEX, mask=transparent)
+    return indexed
+
+def create_gif(frames: Iterable[Image.Image], output_path: str):
+    """
+    Creates a GIF from PIL Image frames.
+    
+    All frames share one palette, instead of quantizing every frame independently.
+    Frames already converted with to_gif_frame (mode 'P') are written as they are,
+    otherwise the palette is computed from the first frame only, which misses
+    colors that only show up later (see the palettize option of render_animation).
+    Pillow keeps every (palettized) frame until the end, about 10 MB for 150 frames
+    of 256x256.
+    
+    :param frames: Iterable of PIL Image objects.
     :param output_path: Path to save the output GIF file.
     """
-    # Convert PIL Images to numpy arrays (required by imageio)
-    np_frames = [iio.core.asarray(frame) for frame in frames]
+    frames = iter(frames)
+    first = next(frames)
+    if first.mode != 'P':
+        palette = gif_palette([first])
+        first = to_gif_frame(first, palette)
+        frames = (to_gif_frame(frame, palette) for frame in frames)
     
-    # Save as GIF
-    iio.imwrite(
-        output_path, 
-        np_frames, 
+    first.save(
+        output_path,
+        save_all=True,
+        append_images=frames,
         duration=1000/FPS, # Duration of each frame in milliseconds
         loop=0, # Loop forever
-        codec='gif'
+        optimize=False, # The palette is already optimized
+        disposal=2, # Restore the (transparent) background between frames
+        transparency=GIF_TRANSPARENT_INDEX,
     )
 
-def create_video(frames: List[Image.Image], output_path: str):
+def create_webp(frames: Iterable[Image.Image], output_path: str):
     """
-    Creates a video (MP4) from a list of PIL Image frames.
+    Creates an animated WebP from PIL Image frames.
     
-    :param frames: List of PIL Image objects.
-    :param output_path: Path to save the output MP4 file.
+    Smaller and faster to encode than a GIF, with full color and alpha. The frames
+    are encoded one at a time with FFmpeg's libwebp_anim encoder (through PyAV), so
+    they are not all kept in memory. If PyAV was built without it, Pillow is used,
+    which collects all frames before encoding: about 150 MB for 150 RGBA frames of 512x512.
+    
+    :param frames: Iterable of PIL Image objects, consumed one frame at a time.
+    :param output_path: Path to save the output WebP file.
     """
-    # Convert PIL Images to numpy arrays (required by imageio)
-    np_frames = [iio.core.asarray(frame) for frame in frames]
-    
-    # Save as MP4
-    iio.imwrite(
-        output_path, 
-        np_frames, 
-        fps=FPS,
-        codec='libx264', # H.264 codec
-        quality=8, # Quality scale (0-10, 10 is best)
-        pixelformat='yuv420p' # For compatibility
+    frames = iter(frames)
+    first = next(frames)
+    if 'libwebp_anim' not in av.codecs_available:
+        _create_webp_pillow(first, frames, output_path)
+        return
+    
+    with av.open(output_path, 'w', format='webp', options={'loop': '0'}) as container: # Loop forever
+        stream = container.add_stream('libwebp_anim', rate=FPS, options={
+            'quality': '80',
+            'compression_level': '4', # Speed/size trade-off (0 fastest, 6 smallest)
+        })
+        stream.width, stream.height = first.size
+        stream.pix_fmt = 'yuva420p' # Keeps the alpha channel
+        for frame in itertools.chain([first], frames):
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(np.asarray(frame.convert('RGBA')), format='rgba')))
+        # Flush the encoder
+        container.mux(stream.encode())
+
+def _create_webp_pillow(first: Image.Image, frames: Iterable[Image.Image], output_path: str):
+    # Pillow's writer needs all frames at once (see create_webp)
+    first.save(
+        output_path,
+        'WEBP',
+        save_all=True,
+        append_images=frames,
+        duration=int(1000/FPS), # Duration of each frame in milliseconds
+        loop=0, # Loop forever
+        quality=80,
+        method=4, # Speed/size trade-off (0 fastest, 6 smallest)
     )
 
+def create_video(frames: Iterable[Image.Image], output_path: str):
+    """
+    Creates a video (MP4) from PIL Image frames.
+    
+    :param frames: Iterable of PIL Image objects, consumed one frame at a time.
+    :param output_path: Path to save the output MP4 file.
+    """
+    with iio.imopen(output_path, 'w', plugin='pyav') as file:
+        file.init_video_stream(
+            'libx264', # H.264 codec
+            fps=FPS,
+            pixel_format='yuv420p', # For compatibility
+        )
+        for frame in frames:
+            file.write_frame(np.asarray(frame.convert('RGB')))
+
+def create_video_stream(frames: Iterable[bytes], output_path: str, width: int, height: int):
+    """
+    Creates a video (MP4) by piping raw frames into an ffmpeg process.
+    
+    Unlike create_video, the frames are not converted to PIL Images or NumPy arrays
+    on the way. Requires the ffmpeg executable on the PATH.
+    
+    :param frames: Iterable of raw RGBA frame buffers (see the raw option of render_animation).
+    :param output_path: Path to save the output MP4 file.
+    :param width: Width of the frames in pixels.
+    :param height: Height of the frames in pixels.
+    """
+    process = subprocess.Popen([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', str(FPS),
+        '-i', '-', # Frames are read from stdin
+        '-c:v', 'libx264', # H.264 codec
+        '-pix_fmt', 'yuv420p', # For compatibility
+        output_path,
+    ], stdin=subprocess.PIPE)
+    stopped_reading = False
+    try:
+        for frame in frames:
+            process.stdin.write(frame)
+    except BrokenPipeError:
+        # ffmpeg exited early, its exit code is reported below
+        stopped_reading = True
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            # Flushing the last frame fails the same way, ffmpeg must still be waited for
+            stopped_reading = True
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {returncode}")
+    if stopped_reading:
+        raise RuntimeError("ffmpeg stopped reading frames before the end of the video")
+
 if __name__ == '__main__':
     print("Video/GIF logic is ready.")